@@ -6,13 +6,43 @@ __author__ = "Alex Witt <awitt2399@utexas.edu>"
 
 import argparse
 import sys
-from typing import List
 
 import numpy as np
+from scipy.linalg import cho_solve_banded, cholesky_banded, eigvalsh_tridiagonal
 
 _GRAVITY = 9.80665  # m / s^2
 
 
+def check_system(
+    num_springs: int, num_masses: int, fix_top: bool, fix_bottom: bool
+) -> None:
+    """Exits if the number of springs cannot form the requested system.
+
+    Args:
+        num_springs: How many springs in the system
+        num_masses: The number of masses in the system
+        fix_top: Whether or not the top is fixed
+        fix_bottom: Whether or not the bottom is fixed
+    """
+    # Springs left over once the top and the gaps between masses are filled.
+    remaining = num_springs - fix_top - (num_masses - 1)
+
+    if fix_bottom and remaining <= 0:
+        print(
+            "The system you've defined is improper. You have supplied "
+            f"{num_springs} springs, but more are needed to complete the system. "
+        )
+        sys.exit(1)
+
+    if not num_masses - 1 <= num_springs <= num_masses + 1:
+        print(
+            "The system you've defined is improper. You have supplied "
+            f"{num_springs} springs for {num_masses} masses, but between "
+            f"{num_masses - 1} and {num_masses + 1} are needed. "
+        )
+        sys.exit(1)
+
+
 def print_system(
     num_springs: int, num_masses: int, fix_top: bool, fix_bottom: bool
 ) -> None:
@@ -25,88 +55,145 @@ def print_system(
         fix_bottom: Whether or not the bottom is fixed
     """
 
-    system = ""
+    system = []
     spring = "  |  \n  /  \n  \\\n  |  \n"
     mass = "  O  \n"
 
     if fix_top:
-        system += "//////\n_____\n"
-        system += spring
-        num_springs -= 1
+        system.append("//////\n_____\n")
+        system.append(spring)
 
     for idx in range(num_masses):
         if idx:
-            system += spring
-            num_springs -= 1
-        system += mass
+            system.append(spring)
+        system.append(mass)
 
     if fix_bottom:
-        if not num_springs:
-            print(
-                "The system you've defined is improper. You have supplied "
-                f"{num_springs} springs, but more are needed to complete the system. "
-            )
-            sys.exit(1)
-
-        system += spring
-        system += " ____\n/////\n"
+        system.append(spring)
+        system.append(" ____\n/////\n")
 
     print("Your system:")
-    print(system)
+    print("".join(system))
 
 
-def return_difference_matrix(rows: int, cols: int, k: int) -> np.ndarray:
-    """Return the difference matrix (A) for the given system.
+def return_force_vector(masses: np.ndarray) -> np.ndarray:
+    """Create a vector of the gravitational forces on the masses.
 
     Args:
-        rows: Number of rows in the matrix.
-        cols: Number of cols in the matrix.
-        k: The diagonal on which the negative terms go. The positive terms
-            will go on (k + 1) diagonal.
+        masses: An array of the physical masses in the system.
 
     Returns:
-        A difference matrix.
+        A vector of the masses multiplied by gravity.
     """
-    eye = np.eye(rows, cols, k=1 + k)
-    eye -= np.eye(rows, cols, k=k)
-    return np.matrix(eye)
+    return _GRAVITY * np.asarray(masses, dtype=np.float64)
 
 
-def return_force_vector(masses: List[float]) -> np.ndarray:
-    """Create a vector of the gravitational forces on the masses.
+def return_spring_constant_matrix(spring_constants: np.ndarray) -> np.ndarray:
+    """Returns the diagonal matrix (C) of spring constants corresponding to what the
+    user supplied. Only the diagonal is stored since every other entry is zero.
 
     Args:
-        masses: A list of the physical masses in the system.
+        spring_constants: The array of spring constants inputted by user.
 
     Returns:
-        A vector of the masses multiplied by gravity.
+        A vector holding the diagonal entries of C.
+    """
+    return np.asarray(spring_constants, dtype=np.float64)
+
+
+def return_stiffness_bands(spring_constants: np.ndarray, num_masses: int) -> np.ndarray:
+    """Returns the tridiagonal stiffness matrix K = A^T C A in the upper banded storage
+    used by `scipy.linalg.cholesky_banded`, without forming A or C.
+
+    Args:
+        spring_constants: The array of spring constants inputted by user.
+        num_masses: How many masses are in the system.
+
+    Returns:
+        A (2, num_masses) array holding the upper and main diagonals of K.
     """
-    return np.matrix([_GRAVITY * mass for mass in masses]).transpose()
+    # Pad free ends with zero-stiffness springs so every mass sits between two springs.
+    k = np.zeros(num_masses + 1)
+    start = int(len(spring_constants) < num_masses)
+    k[start : start + len(spring_constants)] = spring_constants
+
+    bands = np.zeros((2, num_masses))
+    bands[0, 1:] = -k[1:-1]
+    bands[1] = k[:-1] + k[1:]
+    return bands
+
+
+def return_difference_matrix_condition(num_springs: int, num_masses: int) -> float:
+    """Returns the l2-condition of the difference matrix (A) without forming A or
+    computing its SVD.
+
+    The squared singular values of A are the eigenvalues of its non-singular Gram
+    matrix, which is tridiagonal, so only its extreme eigenvalues are needed.
 
+    Args:
+        num_springs: How many springs are in the system.
+        num_masses: How many masses are in the system.
 
-def return_spring_constant_matrix(spring_constants: List[float]) -> np.ndarray:
-    """Returns a simple diagonal matrix where the entries are the given spring constants
-    corresponding to what the user supplied.
+    Returns:
+        The ratio of the largest to the smallest singular value of A.
+    """
+    if num_springs >= num_masses:
+        # A^T A is the stiffness matrix of the same system with unit springs.
+        gram = return_stiffness_bands(np.ones(num_springs), num_masses)
+        diag, off = gram[1], gram[0, 1:]
+    else:
+        # A^T A is singular for a free-free system, so use the smaller A A^T.
+        diag = np.full(num_springs, 2.0)
+        off = np.full(num_springs - 1, -1.0)
+
+    last = len(diag) - 1
+    low = eigvalsh_tridiagonal(diag, off, select="i", select_range=(0, 0))
+    high = eigvalsh_tridiagonal(diag, off, select="i", select_range=(last, last))
+    return float(np.sqrt(high[0] / low[0]))
+
+
+def return_displacements(
+    spring_constants: np.ndarray, masses: np.ndarray
+) -> np.ndarray:
+    """Solves for the displacements of the masses. This is the purely numeric part of
+    `solve_system` and does no printing.
 
     Args:
-        spring_constants: The list of spring constants inputted by user.
+        spring_constants: The spring constants given to the springs.
+        masses: What are the actual masses of the objects in the system.
 
     Returns:
-        A diagonal matrix where the entries are the spring constants.
+        A vector of the displacements of the masses.
     """
-    mat = np.zeros((len(spring_constants), len(spring_constants)), float)
-    np.fill_diagonal(mat, spring_constants)
-    return np.matrix(mat)
+    f = return_force_vector(masses)
+
+    # Combining f = A^T w, w = Ce and e = Au gives the stiffness equation K u = f
+    # with K = A^T C A. K is symmetric positive definite and tridiagonal, so it is
+    # assembled in banded form and solved with a banded Cholesky factorization.
+    K = return_stiffness_bands(spring_constants, len(masses))
+
+    if len(spring_constants) >= len(masses):
+        u = cho_solve_banded((cholesky_banded(K), False), f)
+    else:
+        # A free-free system is singular: uniform translations cost no energy. Take
+        # the minimum-norm least squares solution by removing the net force, pinning
+        # the first mass and then shifting the result to have zero mean.
+        u = np.zeros_like(f)
+        u[1:] = cho_solve_banded((cholesky_banded(K[:, 1:]), False), f[1:] - f.mean())
+        u -= u.mean()
+
+    return u
 
 
 def solve_system(
     num_springs: int,
     num_masses: int,
-    spring_constants: List[float],
-    masses: List[float],
+    spring_constants: np.ndarray,
+    masses: np.ndarray,
     fix_top: bool,
     fix_bottom: bool,
-) -> None:
+    verbose: bool = False,
+) -> np.ndarray:
     """ Main function which computes the desired displacements of the masses.
     
     Args:
@@ -116,32 +203,26 @@ def solve_system(
         masses: What are the actual masses of the objects in the system.
         fix_top: Whether or not the top end fixed.
         fix_bottom: Whether or not the bottom end is fixed.
+        verbose: Whether to print the system and the condition numbers.
     """
-    print_system(num_springs, num_masses, fix_top, fix_bottom)
+    check_system(num_springs, num_masses, fix_top, fix_bottom)
 
-    A = return_difference_matrix(num_springs, num_masses, -(num_springs >= num_masses))
-    _, s, _ = np.linalg.svd(A)
-    print(f"l2-condition of A: {max(s) / min(s):.4f}.")
+    if verbose:
+        print_system(num_springs, num_masses, fix_top, fix_bottom)
 
-    C = return_spring_constant_matrix(spring_constants)
-    _, s, _ = np.linalg.svd(C)
-    print(f"l2-condition of C: {max(s) / min(s):.4f}.")
+        cond_A = return_difference_matrix_condition(num_springs, num_masses)
+        print(f"l2-condition of A: {cond_A:.4f}.")
 
-    _, s, _ = np.linalg.svd(A.transpose())
-    print(f"l2-condition of A transpose: {max(s) / min(s):.4f}.")
+        C = return_spring_constant_matrix(spring_constants)
+        # The singular values of a diagonal matrix are the magnitudes of its
+        # entries.
+        s = np.abs(C)
+        print(f"l2-condition of C: {s.max() / s.min():.4f}.")
 
-    f = return_force_vector(masses)
-
-    # Now solve the force balance equation: f = A.transpose() * w
-    w = np.linalg.pinv(A.transpose()) * f
-
-    # Next, solve the internal force equations: w = Ce
-    e = np.linalg.pinv(C) * w
+        # A and its transpose share the same singular values.
+        print(f"l2-condition of A transpose: {cond_A:.4f}.")
 
-    # Finally, compute the displacements using: e = Au
-    u = np.linalg.pinv(A) * e
-
-    return u
+    return return_displacements(spring_constants, masses)
 
 
 if __name__ == "__main__":
@@ -171,14 +252,17 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     # Do some general args processing to ensure a feasible system.
-    spring_constants = [float(c.strip()) for c in args.spring_constants.split(",")]
-    masses = [float(c.strip()) for c in args.masses.split(",")]
+    spring_constants = np.array(args.spring_constants.split(","), dtype=np.float64)
+    masses = np.array(args.masses.split(","), dtype=np.float64)
 
     # Assert we either have a fixed-fixed, free-free, or fixed-free
     assert (
         args.fix_bottom == args.fix_top or args.fix_top
     ), """Only three systems are supported: fixed-fixed, free-free, or fixed-free"""
 
+    # A non-positive spring leaves the stiffness matrix singular or indefinite.
+    assert (spring_constants > 0).all(), """All spring constants must be positive"""
+
     displacements = solve_system(
         len(spring_constants),
         len(masses),
@@ -186,6 +270,7 @@ if __name__ == "__main__":
         masses,
         args.fix_top,
         args.fix_bottom,
+        verbose=True,
     )
 
     print(f"Displacements for the system:\n {displacements}")
@@ -0,0 +1,20 @@
+""" Regression checks for the spring-mass solver. """
+
+import numpy as np
+
+from main import _GRAVITY, return_displacements
+
+
+def test_single_mass_fixed_free() -> None:
+    u = return_displacements(np.array([1.0]), np.array([1.0]))
+    np.testing.assert_allclose(u, [_GRAVITY])
+
+
+def test_single_mass_fixed_fixed() -> None:
+    u = return_displacements(np.array([1.0, 1.0]), np.array([1.0]))
+    np.testing.assert_allclose(u, [_GRAVITY / 2])
+
+
+def test_two_masses_free_free() -> None:
+    u = return_displacements(np.array([2.0]), np.array([1.0, 3.0]))
+    np.testing.assert_allclose(u, [-_GRAVITY / 4, _GRAVITY / 4])